@@ -2,10 +2,42 @@
 Handles the REST calls and responses.
 """
 
+import asyncio
 import json
 import logging
+from urllib import parse
 
 import requests
+from requests import adapters
+
+# Prefer the C-accelerated orjson codec when it is available. Its
+# JSONDecodeError subclasses ValueError, so callers catch the same type.
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+if _json.__name__ == 'orjson':
+    def _dumps(obj):
+        # Accept non-str dict keys ({1: 'x'} -> {"1": "x"}) like json.dumps,
+        # and let json.dumps handle anything else orjson rejects (e.g.
+        # integers beyond 64 bits) so no body that used to work fails now.
+        try:
+            return _json.dumps(obj, option=_json.OPT_NON_STR_KEYS)
+        except TypeError:
+            return json.dumps(obj).encode()
+else:
+    _dumps = _json.dumps
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 LOG = logging.getLogger(__name__)
 
@@ -60,8 +92,12 @@ class NotFound(ClientException):
     http_status = 404
     message = "Not found"
 
-_code_map = dict((c.http_status, c) for c in [BadRequest, Unauthorized,
-                                              Forbidden, NotFound])
+_code_map = {
+    400: BadRequest,
+    401: Unauthorized,
+    403: Forbidden,
+    404: NotFound,
+}
 
 def from_response(response, body):
     """
@@ -78,51 +114,116 @@ def from_response(response, body):
     if body:
         message = "n/a"
         details = "n/a"
-        if hasattr(body, 'error'):
-            error = body['error']
+        # NOTE: hasattr(body, 'error') is always False for a decoded dict.
+        error = body.get('error') if isinstance(body, dict) else None
+        if isinstance(error, dict):
             message = error.get('message', message)
             details = error.get('details', details)
         return cls(code=response.status_code, message=message, details=details,
                    response=response)
     else:
-        return cls(code=response.status_code, message=response.reason,
+        # NOTE: httpx responses expose the status text as ``reason_phrase``.
+        reason = getattr(response, 'reason', None)
+        if reason is None:
+            reason = getattr(response, 'reason_phrase', None)
+        return cls(code=response.status_code, message=reason,
                    response=response)
 
+def _encode_body(kwargs, json_headers, body_key):
+    """
+    Move a ``body`` request argument into ``kwargs[body_key]`` as JSON and
+    set the JSON request headers.
+    """
+    if 'body' in kwargs:
+        # Both clients send the default headers on every request already,
+        # so only build a new dict when the caller supplied headers.
+        user_headers = kwargs.get('headers')
+        kwargs['headers'] = ({**json_headers, **user_headers}
+                             if user_headers else json_headers)
+        kwargs[body_key] = _dumps(kwargs.pop('body'))
+
+def _decode_body(resp):
+    """
+    Return the JSON-decoded body of ``resp``, raising the mapped
+    :class:`ClientException` for error statuses.
+    """
+    body = None
+    if resp.content:
+        try:
+            body = _json.loads(resp.content)
+        except ValueError as exc:
+            LOG.error("Load http response text error: %s", exc)
+
+    if resp.status_code >= 400:
+        raise from_response(resp, body)
+
+    return body
+
 class HTTPClient(object):
 
     SENSITIVE_HEADERS = ('X-Auth-Token', 'X-Subject-Token',)
     USER_AGENT = 'python-httpclient'
+    _DEFAULT_HEADERS = {'User-Agent': USER_AGENT,
+                        'Accept': 'application/json'}
+    _JSON_HEADERS = {**_DEFAULT_HEADERS,
+                     'Content-Type': 'application/json'}
 
-    def __init__(self, username=None, password=None, timeout=None):
+    def __init__(self, username=None, password=None, timeout=None,
+                 pool_size=10):
         self.username = username
         self.password = password
         self.timeout = timeout
 
+        # Share one session across calls so that keep-alive connections are
+        # pooled and reused instead of paying a TCP/TLS handshake per request.
+        self._session = requests.Session()
+        self._session.headers.update(self._DEFAULT_HEADERS)
+        adapter = adapters.HTTPAdapter(pool_connections=pool_size,
+                                       pool_maxsize=pool_size,
+                                       max_retries=0)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def close(self):
+        """Release the pooled connections held by the session."""
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
     def request(self, url, method, **kwargs):
-        kwargs.setdefault('headers', kwargs.get('headers', {}))
-        kwargs['headers']['User-Agent'] = self.USER_AGENT
-        kwargs['headers']['Accept'] = 'application/json'
+        """
+        Send a request and return ``(resp, body)`` with the decoded JSON body.
+
+        Pass ``stream_json=True`` to get an iterator over the items of a
+        top-level JSON array instead, parsed incrementally from the socket
+        with ``ijson``; a string value is used as the ijson prefix (e.g.
+        ``'servers.item'``). The connection is only returned to the pool once
+        the iterator is exhausted or ``resp.close()`` is called.
+        """
+        stream_json = kwargs.pop('stream_json', False)
 
-        if 'body' in kwargs:
-            kwargs['headers']['Content-Type'] = 'application/json'
-            kwargs['data'] = json.dumps(kwargs.pop('body'))
+        _encode_body(kwargs, self._JSON_HEADERS, 'data')
 
         if self.timeout:
             kwargs.setdefault('timeout', self.timeout)
 
-        resp = requests.request(method, url, **kwargs)
+        if stream_json:
+            if ijson is None:
+                raise ImportError("stream_json requires the ijson package")
+            kwargs['stream'] = True
 
-        body = None
-        if resp.text:
-            try:
-                body = json.loads(resp.text)
-            except ValueError as exc:
-                LOG.error("Load http response text error: %s", exc)
+        resp = self._session.request(method, url, **kwargs)
 
-        if resp.status_code >= 400:
-            raise from_response(resp, body)
+        if stream_json and resp.status_code < 400:
+            prefix = stream_json if isinstance(stream_json, str) else 'item'
+            resp.raw.decode_content = True
+            return resp, ijson.items(resp.raw, prefix)
 
-        return resp, body
+        return resp, _decode_body(resp)
 
     def send_request(self, url, method, **kwargs):
         try:
@@ -143,3 +244,141 @@ class HTTPClient(object):
 
     def delete(self, url, **kwargs):
         return self.send_request(url, 'DELETE', **kwargs)
+
+
+class AsyncHTTPClient(object):
+    """
+    Pipelined asynchronous variant of :class:`HTTPClient`.
+
+    Requests are buffered in a per-host queue and a worker coroutine per host
+    dispatches up to ``batch_size`` of them concurrently over pooled
+    keep-alive connections. Requires the optional ``httpx`` package.
+
+    Usage::
+
+        async with AsyncHTTPClient() as client:
+            fut = client.enqueue('http://host/v1/items', 'GET')
+            resp, body = await fut
+    """
+
+    USER_AGENT = HTTPClient.USER_AGENT
+    _DEFAULT_HEADERS = HTTPClient._DEFAULT_HEADERS
+    _JSON_HEADERS = HTTPClient._JSON_HEADERS
+
+    def __init__(self, timeout=None, max_connections=64, batch_size=32,
+                 keepalive_expiry=60):
+        if httpx is None:
+            raise ImportError("AsyncHTTPClient requires the httpx package")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.batch_size = batch_size
+        self.keepalive_expiry = keepalive_expiry
+        self._client = None
+        self._queues = {}
+        self._workers = {}
+
+    def _get_client(self):
+        # The client is bound to the running event loop, so build it lazily.
+        if self._client is None:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry)
+            self._client = httpx.AsyncClient(
+                limits=limits, timeout=self.timeout,
+                headers=self._DEFAULT_HEADERS)
+        return self._client
+
+    async def request(self, url, method, **kwargs):
+        _encode_body(kwargs, self._JSON_HEADERS, 'content')
+
+        resp = await self._get_client().request(method, url, **kwargs)
+
+        return resp, _decode_body(resp)
+
+    def enqueue(self, url, method, **kwargs):
+        """
+        Queue a request and return an :class:`asyncio.Future` resolving to
+        ``(resp, body)``. Must be called from within a running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        host = parse.urlsplit(url).netloc
+        queue = self._queues.get(host)
+        if queue is None:
+            queue = self._queues[host] = asyncio.Queue()
+            self._workers[host] = loop.create_task(self._worker(queue))
+        queue.put_nowait((future, url, method, kwargs))
+        return future
+
+    async def _worker(self, queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            try:
+                results = await asyncio.gather(
+                    *[self.request(url, method, **kwargs)
+                      for _, url, method, kwargs in batch],
+                    return_exceptions=True)
+            except asyncio.CancelledError:
+                # Don't leave callers awaiting the in-flight batch hanging.
+                for future, _, _, _ in batch:
+                    future.cancel()
+                raise
+
+            for (future, _, _, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def aclose(self):
+        """
+        Stop the host workers and release the pooled connections. Requests
+        that have not completed yet have their futures cancelled.
+        """
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        # Cancel the requests that were still queued so their callers don't
+        # wait forever.
+        for queue in self._queues.values():
+            while not queue.empty():
+                future = queue.get_nowait()[0]
+                future.cancel()
+        self._workers = {}
+        self._queues = {}
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.aclose()
+
+    async def _send_batch(self, reqs, return_exceptions):
+        try:
+            futures = [self.enqueue(url, method, **(kwargs or {}))
+                       for url, method, kwargs in reqs]
+            return await asyncio.gather(*futures,
+                                        return_exceptions=return_exceptions)
+        finally:
+            await self.aclose()
+
+    def send_batch(self, reqs, return_exceptions=False):
+        """
+        Synchronously send a batch of requests and return their
+        ``(resp, body)`` results in order.
+
+        :param reqs: iterable of ``(url, method, kwargs)`` tuples, where
+                     ``kwargs`` may be ``None``.
+        :param return_exceptions: return exceptions in place of results
+                                  instead of raising the first one.
+        """
+        return asyncio.run(self._send_batch(list(reqs), return_exceptions))
@@ -1,48 +1,406 @@
 # -*- coding: utf-8 -*-
 
-import errno
+import atexit
+import locale
 import logging
 import logging.config
 import logging.handlers
 import os
+import queue
+import sys
+import threading
+import time
+import traceback
 
 class MakeDirFileHandler(logging.handlers.RotatingFileHandler):
     def __init__(self, filename, mode='a', maxBytes=0, backupCount=0,
-                 encoding=None, delay=0):
+                 encoding=None, delay=0, maxBatch=8192,
+                 queueHighWaterRatio=0.3):
         self._make_dir(os.path.dirname(filename))
+        # Used by config_logging() to size the BatchQueueListener feeding us.
+        self.maxBatch = maxBatch
+        self.queueHighWaterRatio = queueHighWaterRatio
         logging.handlers.RotatingFileHandler.__init__(
             self, filename, mode, maxBytes, backupCount, encoding, delay)
 
+    def handleBatch(self, records):
+        """Filter and emit a batch of records under a single lock hold."""
+        records = [record for record in records if self.filter(record)]
+        if records:
+            self.acquire()
+            try:
+                self.emitBatch(records)
+            finally:
+                self.release()
+
+    def emitBatch(self, records):
+        # Concatenate the formatted records and write them in as few calls as
+        # possible, splitting the batch only where a rollover is due.
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            msgs = [self.format(record) + self.terminator
+                    for record in records]
+            start = 0
+            if self.maxBytes > 0 and os.path.isfile(self.baseFilename):
+                self.stream.seek(0, 2)
+                size = self.stream.tell()
+                for i, msg in enumerate(msgs):
+                    if size and size + len(msg) >= self.maxBytes:
+                        if i > start:
+                            self.stream.write(''.join(msgs[start:i]))
+                        self.doRollover()
+                        if self.stream is None:
+                            self.stream = self._open()
+                        start = i
+                        size = 0
+                    size += len(msg)
+            self.stream.write(''.join(msgs[start:]))
+            # One flush per batch keeps the syscall count low without leaving
+            # records of a quiet log sitting in the userspace buffer.
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(records[-1])
+
     @staticmethod
     def _make_dir(path):
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+class FastFormatter(logging.Formatter):
+    """Formatter specialised for the ``log_file`` format.
+
+    Builds the line directly instead of interpolating the template, only
+    calls ``time.strftime`` once per second of log time and skips the
+    exception/stack formatting unless the record carries them.
+    """
+    FORMAT = '%(asctime)s %(module)s:%(lineno)s %(levelname)s %(message)s'
+
+    def __init__(self):
+        logging.Formatter.__init__(self, self.FORMAT)
+        self._last_asctime = (None, None)
+
+    def _cached_asctime(self, created):
+        sec = int(created)
+        last_sec, last_str = self._last_asctime
+        if sec != last_sec:
+            last_str = time.strftime(self.default_time_format,
+                                     self.converter(sec))
+            self._last_asctime = (sec, last_str)
+        return last_str
+
+    def format(self, record):
+        record.message = record.getMessage()
+        record.asctime = self.default_msec_format % (
+            self._cached_asctime(record.created), record.msecs)
+        s = (f"{record.asctime} {record.module}:{record.lineno} "
+             f"{record.levelname} {record.message}")
+        if record.exc_info or record.exc_text or record.stack_info:
+            if record.exc_info and not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            if record.exc_text:
+                if s[-1:] != "\n":
+                    s = s + "\n"
+                s = s + record.exc_text
+            if record.stack_info:
+                if s[-1:] != "\n":
+                    s = s + "\n"
+                s = s + self.formatStack(record.stack_info)
+        return s
+
+class MultiBufferedRotatingFileHandler(MakeDirFileHandler):
+    """Rotating file handler that hands disk writes to a writer thread.
+
+    Formatted records are copied into a ring of ``bufferCount`` preallocated
+    buffers. Each buffer cycles EMPTY -> FILLING -> FULL -> FLUSHING -> EMPTY:
+    emitters fill one buffer while the writer thread flushes the full ones,
+    so emitters only wait on disk I/O when every buffer is full. A partially
+    filled buffer is flushed after ``flushInterval`` seconds of inactivity.
+    Once the writer has stopped (after close()), records are written
+    synchronously by the emitting thread instead.
+    """
+    EMPTY, FILLING, FULL, FLUSHING = range(4)
+
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0,
+                 encoding=None, delay=0, bufferCount=4, bufferSize=65536,
+                 flushInterval=1.0, **kwargs):
+        MakeDirFileHandler.__init__(self, filename, mode, maxBytes,
+                                    backupCount, encoding, delay, **kwargs)
+        if self.encoding in (None, 'locale'):
+            self._encoding = locale.getpreferredencoding(False)
+        else:
+            self._encoding = self.encoding
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self._buffers = [bytearray(bufferSize) for _ in range(bufferCount)]
+        self._lengths = [0] * bufferCount
+        self._states = [self.EMPTY] * bufferCount
+        self._states[0] = self.FILLING
+        self._filling = 0
+        self._flushing = 0
+        self._closing = False
+        self._stopped = False
+        self._cond = threading.Condition()
+        # Serialises stream access between the writer thread and emitters
+        # writing synchronously once the writer has stopped.
+        self._io_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _open(self):
+        mode = self.mode if 'b' in self.mode else self.mode + 'b'
+        return open(self.baseFilename, mode)
+
+    def _encode(self, record):
+        return (self.format(record) + self.terminator).encode(
+            self._encoding, self.errors or 'strict')
+
+    def _drain(self):
+        # The writer has stopped: write out everything still buffered, in
+        # ring order, from the calling thread. Leaves the current buffer
+        # FILLING and the others EMPTY. Must be called with self._cond held.
+        count = len(self._buffers)
+        for k in range(count):
+            i = (self._flushing + k) % count
+            if self._lengths[i]:
+                self._write(memoryview(self._buffers[i])[:self._lengths[i]])
+                self._lengths[i] = 0
+            self._states[i] = self.EMPTY
+        self._states[self._filling] = self.FILLING
+        self._flushing = self._filling
+
+    def _swap(self):
+        # Mark the filling buffer FULL and move on to the next one in the
+        # ring, waiting for the writer if it has not been flushed yet.
+        # Never waits once the writer has stopped, nobody would wake us.
+        # Must be called with self._cond held.
+        if self._stopped:
+            self._drain()
+            return
+        self._states[self._filling] = self.FULL
+        self._cond.notify_all()
+        nxt = (self._filling + 1) % len(self._buffers)
+        while self._states[nxt] != self.EMPTY:
+            if self._stopped:
+                self._drain()
+                return
+            self._cond.wait()
+        self._states[nxt] = self.FILLING
+        self._filling = nxt
+
+    def _append(self, data):
+        # Must be called with self._cond held. Records are only split across
+        # buffers when they are larger than a whole buffer.
+        if self._stopped:
+            self._drain()
+            self._write(data)
+            return
+        while data:
+            i = self._filling
+            used = self._lengths[i]
+            if used and used + len(data) > self.bufferSize:
+                self._swap()
+                continue
+            chunk = data[:self.bufferSize - used]
+            self._buffers[i][used:used + len(chunk)] = chunk
+            self._lengths[i] = used + len(chunk)
+            data = data[len(chunk):]
+            if self._lengths[i] == self.bufferSize:
+                self._swap()
+
+    def emit(self, record):
+        try:
+            data = self._encode(record)
+            with self._cond:
+                self._append(data)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def emitBatch(self, records):
         try:
-            os.makedirs(path)
-        except OSError as exc:
-            if exc.errno == errno.EEXIST and os.path.isdir(path):
-                pass
+            chunks = [self._encode(record) for record in records]
+            with self._cond:
+                for data in chunks:
+                    self._append(data)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(records[-1])
+
+    def _write(self, data):
+        with self._io_lock:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and os.path.isfile(self.baseFilename):
+                self.stream.seek(0, 2)
+                size = self.stream.tell()
+                if size and size + len(data) > self.maxBytes:
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+            self.stream.write(data)
+            self.stream.flush()
+
+    def _write_loop(self):
+        with self._cond:
+            try:
+                self._flush_loop()
+            finally:
+                self._stopped = True
+                self._cond.notify_all()
+
+    def _flush_loop(self):
+        # Runs in the writer thread with self._cond held.
+        while True:
+            i = self._flushing
+            while self._states[i] != self.FULL:
+                if self._closing:
+                    return
+                if (not self._cond.wait(self.flushInterval) and
+                        self._states[i] == self.FILLING and
+                        self._lengths[i]):
+                    self._swap()
+            self._states[i] = self.FLUSHING
+            self._cond.release()
+            try:
+                view = memoryview(self._buffers[i])
+                self._write(view[:self._lengths[i]])
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+            finally:
+                self._cond.acquire()
+            self._lengths[i] = 0
+            self._states[i] = self.EMPTY
+            self._flushing = (i + 1) % len(self._buffers)
+            self._cond.notify_all()
+
+    def flush(self):
+        """Wait until everything emitted so far has been written."""
+        with self._cond:
+            if self._lengths[self._filling]:
+                self._swap()
+            while self._flushing != self._filling and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                self._drain()
+
+    def close(self):
+        with self._cond:
+            if self._lengths[self._filling]:
+                self._swap()
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join()
+        # Lock order is handler lock -> _cond -> _io_lock everywhere. Don't
+        # take _io_lock here: FileHandler.close() acquires the handler lock,
+        # which already serialises us against late emitters.
+        MakeDirFileHandler.close(self)
+
+class BatchQueue(queue.Queue):
+    """Queue that only wakes its consumer once ``highWater`` items wait.
+
+    The consumer is expected to poll with :meth:`wait_ready` and drain with
+    ``get_nowait``; producers then never wake it for a single record.
+    """
+    def __init__(self, highWater):
+        queue.Queue.__init__(self)
+        self.highWater = max(1, highWater)
+        self.ready = threading.Condition(self.mutex)
+
+    def _put(self, item):
+        queue.Queue._put(self, item)
+        if len(self.queue) >= self.highWater:
+            self.ready.notify()
+
+    def wait_ready(self, timeout):
+        with self.ready:
+            if len(self.queue) < self.highWater:
+                self.ready.wait(timeout)
+
+    def wake(self):
+        with self.ready:
+            self.ready.notify()
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """QueueListener that drains a BatchQueue in batches.
+
+    The thread sleeps until the queue crosses its high-water mark or
+    ``interval`` seconds pass, then hands up to ``max_batch`` records at once
+    to handlers providing ``handleBatch`` (others get them one by one).
+    """
+    def __init__(self, queue, *handlers, respect_handler_level=False,
+                 max_batch=8192, interval=1.0):
+        logging.handlers.QueueListener.__init__(
+            self, queue, *handlers,
+            respect_handler_level=respect_handler_level)
+        self.max_batch = max_batch
+        self.interval = interval
+
+    def enqueue_sentinel(self):
+        logging.handlers.QueueListener.enqueue_sentinel(self)
+        self.queue.wake()
+
+    def handle_batch(self, records):
+        records = [self.prepare(record) for record in records]
+        for handler in self.handlers:
+            if self.respect_handler_level:
+                batch = [record for record in records
+                         if record.levelno >= handler.level]
+            else:
+                batch = records
+            if not batch:
+                continue
+            handle_batch = getattr(handler, 'handleBatch', None)
+            if handle_batch is not None:
+                handle_batch(batch)
             else:
-                raise
+                for record in batch:
+                    handler.handle(record)
+
+    def _monitor(self):
+        q = self.queue
+        full = False
+        while True:
+            if not full:
+                q.wait_ready(self.interval)
+            records = []
+            stop = False
+            while len(records) < self.max_batch:
+                try:
+                    record = q.get_nowait()
+                except queue.Empty:
+                    break
+                q.task_done()
+                if record is self._sentinel:
+                    stop = True
+                    break
+                records.append(record)
+            if records:
+                self.handle_batch(records)
+            if stop:
+                break
+            full = len(records) >= self.max_batch
 
 # To define a dictionary of logging settings. These settings describles the
 # loggers, handlers, formatters and filters that you want in your logging setup.
 CUSTOM_LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'filters': {
-        'require_debug_true': {
-            '()': 'ssgw.utils.log.DebugLogFilter',
-        },
-    },
     'formatters': {
         'log_file': {
-            'format': '%(asctime)s %(module)s:%(lineno)s %(levelname)s '
-                      '%(message)s',
+            # '%(asctime)s %(module)s:%(lineno)s %(levelname)s %(message)s'
+            '()': 'ssgw.utils.log.FastFormatter',
         },
     },
     'handlers': {
         'ssgw_log_file': {
             'level': 'DEBUG',
-            'filters': ['require_debug_true'],
             'class': 'ssgw.utils.log.MakeDirFileHandler',
             'filename': '/var/log/ssgw/ssgw.log',
             'formatter': 'log_file',
@@ -60,12 +418,47 @@ CUSTOM_LOGGING = {
     },
 }
 
-class DebugLogFilter(logging.Filter):
-    def filter(self, record):
-        ret = True
-        #if record.levelno == logging.DEBUG:
-        #    ret = True if settings.DEBUG else False
-        return ret
+_listeners = []
 
-def config_logging():
+def _stop_listeners():
+    while _listeners:
+        _listeners.pop().stop()
+
+atexit.register(_stop_listeners)
+
+def config_logging(debug=True):
+    """Apply CUSTOM_LOGGING and move file writes off the calling threads.
+
+    ``debug`` toggles DEBUG records through the logger level, so disabled
+    records are rejected by ``Logger.isEnabledFor`` before any handler or
+    filter runs.
+
+    Each configured logger gets a single QueueHandler; a BatchQueueListener
+    thread drains the queue into the real handlers in batches.
+    """
+    _stop_listeners()
+    # None of the configured formats use these, so skip collecting them.
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
     logging.config.dictConfig(CUSTOM_LOGGING)
+
+    for name in CUSTOM_LOGGING['loggers']:
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.DEBUG if debug else logging.INFO)
+        handlers = logger.handlers[:]
+        if not handlers:
+            continue
+        for handler in handlers:
+            logger.removeHandler(handler)
+        max_batch = min(getattr(handler, 'maxBatch', 8192)
+                        for handler in handlers)
+        ratio = min(getattr(handler, 'queueHighWaterRatio', 0.3)
+                    for handler in handlers)
+        log_queue = BatchQueue(int(max_batch * ratio))
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        listener = BatchQueueListener(
+            log_queue, *handlers, respect_handler_level=True,
+            max_batch=max_batch)
+        listener.start()
+        _listeners.append(listener)
@@ -6,17 +6,18 @@ import functools
 import logging
 import os
 import random
-import retrying
 import signal
 import subprocess
 import sys
-import threading
 import time
 
 from pyutils.utils import timeutils
 
 LOG = logging.getLogger(__name__)
 
+# Seconds a timed out command gets to exit after SIGTERM before SIGKILL.
+_TERMINATE_GRACE_PERIOD = 1.0
+
 class UnknownArgumentError(Exception):
     def __init__(self, message=None):
         super(UnknownArgumentError, self).__init__(message)
@@ -93,11 +94,17 @@ def execute(*cmd, **kwargs):
                             is executed. WARNING: On windows, we silently
                             drop this preexec_fn as it is not supported by
                             subprocess.Popen on windows (throws a
-                            ValueError)
+                            ValueError). Setting it forces a full fork()
+                            of the parent, which is much slower for large
+                            processes than the default spawn path.
     :type preexec_fn:       function()
     :param interval: The multiplier
     :param backoff_rate: Base used for the exponential backoff
     :param timeout: Timeout defined in seconds
+    :param stdout:          Where the child's stdout goes. Defaults to
+                            subprocess.PIPE; pass subprocess.DEVNULL (or a
+                            file) when the output is not needed.
+    :param stderr:          Same as ``stdout``, for the child's stderr.
     :returns:               (stdout, stderr) from process execution
     :raises:                :class:`UnknownArgumentError` on
                             receiving unknown arguments
@@ -106,15 +113,8 @@ def execute(*cmd, **kwargs):
     """
 
     # Since python 2 doesn't have nonlocal we use a mutable variable to store
-    # the previous attempt number, the timeout handler, and the process that
-    # timed out
-    shared_data = [0, None, None]
-
-    def on_timeout(proc):
-        LOG.warning('Stopping %(cmd)s with signal %(signal)s after %(time)ss.',
-                    {'signal': sig_end, 'cmd': cmd, 'time': timeout})
-        shared_data[2] = proc
-        proc.send_signal(sig_end)
+    # the previous attempt number
+    shared_data = [0]
 
     def on_execute(proc):
         # This function will be called upon process creation with the object
@@ -122,25 +122,11 @@ def execute(*cmd, **kwargs):
         # `processutils.execute` to track process creation asynchronously.
         # Sleep if this is not the first try and we have a timeout interval
         if shared_data[0] and interval:
-            exp = backoff_rate ** shared_data[0]
-            wait_for = max(0, interval * exp)
+            wait_for = waits[shared_data[0]]
             LOG.debug('Sleeping for %s seconds', wait_for)
             time.sleep(wait_for)
-        # Increase the number of tries and start the timeout timer
+        # Increase the number of tries
         shared_data[0] += 1
-        if timeout:
-            shared_data[2] = None
-            shared_data[1] = threading.Timer(timeout, on_timeout, (proc,))
-            shared_data[1].start()
-
-    def on_completion(proc):
-        # This function will be called upon process completion with the
-        # object as a argument. The Purpose of this is to allow the caller of
-        # `processutils.execute` to track process completion asynchronously.
-        # This is always called regardless of success or failure
-        # Cancel the timeout timer
-        if shared_data[1]:
-            shared_data[1].cancel()
 
     # We will be doing the wait ourselves in on_execute
     if 'delay_on_retry' in kwargs:
@@ -161,6 +147,8 @@ def execute(*cmd, **kwargs):
     loglevel = kwargs.pop('loglevel', logging.DEBUG)
     preexec_fn = kwargs.pop('preexec_fn', None)
     timeout = kwargs.pop('timeout', None)
+    stdout_dest = kwargs.pop('stdout', subprocess.PIPE)
+    stderr_dest = kwargs.pop('stderr', subprocess.PIPE)
     default_raise_timeout = kwargs.get('check_exit_code', True)
 
     if isinstance(check_exit_code, bool):
@@ -172,7 +160,15 @@ def execute(*cmd, **kwargs):
     if kwargs:
         raise UnknownArgumentError('Got unknown keyword args: %r' % kwargs)
 
-    cmd = [str(c) for c in cmd]
+    if interval:
+        # Backoff schedule indexed by the number of attempts already made.
+        waits = tuple(max(0, interval * backoff_rate ** i)
+                      for i in range(attempts))
+
+    # Popen accepts any sequence, so only rebuild cmd when some argument
+    # still needs converting to a string.
+    if not all(type(c) is str for c in cmd):
+        cmd = [str(c) for c in cmd]
 
     watch = timeutils.StopWatch()
     while attempts > 0:
@@ -183,14 +179,26 @@ def execute(*cmd, **kwargs):
             LOG.log(loglevel, 'Running cmd (subprocess): %s', cmd)
             _PIPE = subprocess.PIPE  # pylint: disable=E1101
 
-            on_preexec_fn = functools.partial(_subprocess_setup,
-                                              preexec_fn)
+            # restore_signals=True (the Popen default) already resets SIGPIPE
+            # in the child. Leaving preexec_fn unset lets subprocess spawn
+            # with vfork() (Python 3.10+) instead of a full fork().
+            if preexec_fn is not None:
+                on_preexec_fn = functools.partial(_subprocess_setup,
+                                                  preexec_fn)
+            else:
+                on_preexec_fn = None
             close_fds = True
 
+            # Only set up pipes that will actually be used. Without input
+            # the child still sees EOF on stdin, as with a closed pipe.
+            stdin_src = (_PIPE if process_input is not None
+                         else subprocess.DEVNULL)
+            piped = _PIPE in (stdin_src, stdout_dest, stderr_dest)
+
             obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
+                                   stdin=stdin_src,
+                                   stdout=stdout_dest,
+                                   stderr=stderr_dest,
                                    close_fds=close_fds,
                                    preexec_fn=on_preexec_fn,
                                    shell=shell,  # nosec:B604
@@ -199,14 +207,50 @@ def execute(*cmd, **kwargs):
 
             on_execute(obj)
 
+            # communicate() enforces the timeout itself, so no watchdog
+            # thread is needed.
             try:
-                result = obj.communicate(process_input)
-                obj.stdin.close()  # pylint: disable=E1101
-                _returncode = obj.returncode  # pylint: disable=E1101
-                LOG.log(loglevel, 'CMD "%s" returned: %s in %0.3fs',
-                        cmd, _returncode, watch.elapsed())
-            finally:
-                on_completion(obj)
+                if piped:
+                    result = obj.communicate(process_input, timeout=timeout)
+                else:
+                    obj.wait(timeout=timeout)
+                    result = (None, None)
+            except subprocess.TimeoutExpired:
+                # Ask politely first, then kill a child that ignores SIGTERM
+                # so the timeout is actually honoured.
+                sig_end = signal.SIGTERM
+                obj.terminate()
+                try:
+                    (stdout, stderr) = obj.communicate(
+                        timeout=_TERMINATE_GRACE_PERIOD)
+                except subprocess.TimeoutExpired:
+                    sig_end = signal.SIGKILL
+                    obj.kill()
+                    try:
+                        (stdout, stderr) = obj.communicate(
+                            timeout=_TERMINATE_GRACE_PERIOD)
+                    except subprocess.TimeoutExpired:
+                        # Descendants that inherited the pipes can keep them
+                        # open; give up on the output rather than wait.
+                        for pipe in (obj.stdout, obj.stderr):
+                            if pipe:
+                                pipe.close()
+                        obj.wait()
+                        (stdout, stderr) = (None, None)
+                LOG.warning('Stopped %(cmd)s with signal %(signal)s after '
+                            '%(time)ss.', {'signal': sig_end,
+                                           'cmd': cmd, 'time': timeout})
+                stdout = b'' if stdout is None else stdout
+                stderr = b'' if stderr is None else stderr
+                raise ProcessExecutionError(
+                    exit_code=obj.returncode, stdout=stdout, stderr=stderr,
+                    cmd=cmd, description='Command timed out after %ss.'
+                    % timeout)
+            # Streams that were not piped read back as empty output.
+            result = tuple(b'' if r is None else r for r in result)
+            _returncode = obj.returncode  # pylint: disable=E1101
+            LOG.log(loglevel, 'CMD "%s" returned: %s in %0.3fs',
+                    cmd, _returncode, watch.elapsed())
 
             if not ignore_exit_code and _returncode not in check_exit_code:
                 (stdout, stderr) = result
@@ -238,46 +282,41 @@ def execute(*cmd, **kwargs):
             else:
                 LOG.log(loglevel, '%r failed. Retrying.', cmd)
                 if delay_on_retry:
-                    time.sleep(random.randint(20, 200) / 100.0)
-        finally:
-            # NOTE(termie): this appears to be necessary to let the subprocess
-            #               call clean something up in between calls, without
-            #               it two execute calls in a row hangs the second one
-            # NOTE(bnemec): termie's comment above is probably specific to the
-            #               eventlet subprocess module, but since we still
-            #               have to support that we're leaving the sleep.  It
-            #               won't hurt anything in the stdlib case anyway.
-            time.sleep(0)
-
-def retry(exceptions, interval=1, retries=3, backoff_rate=2):
-
-    def _retry_on_exception(e):
-        return isinstance(e, exceptions)
-
-    def _backoff_sleep(previous_attempt_number, delay_since_first_attempt_ms):
-        exp = backoff_rate ** previous_attempt_number
-        wait_for = max(0, interval * exp)
-        LOG.debug("Sleeping for %s seconds", wait_for)
-        return wait_for * 1000.0
-
-    def _print_stop(previous_attempt_number, delay_since_first_attempt_ms):
-        delay_since_first_attempt = delay_since_first_attempt_ms / 1000.0
-        LOG.debug("Failed attempt %s", previous_attempt_number)
-        LOG.debug("Have been at this for %s seconds",
-                  delay_since_first_attempt)
-        return previous_attempt_number == retries
+                    time.sleep(random.uniform(0.2, 2.0))
+
+def retry(exceptions, interval=1, retries=3, backoff_rate=2, jitter=False):
+    """Retry the decorated function when it raises one of ``exceptions``.
+
+    Waits ``interval * backoff_rate ** n`` seconds after the n-th failed
+    attempt. With ``jitter`` each wait is drawn uniformly from 50% to 150%
+    of that value so concurrent callers don't retry in lockstep.
+    """
 
     if retries < 1:
         raise ValueError(_('Retries must be greater than or '
                          'equal to 1 (received: %s). ') % retries)
 
+    waits = tuple(max(0, interval * backoff_rate ** i)
+                  for i in range(retries + 1))
+
     def _decorator(f):
 
         def _wrapper(*args, **kwargs):
-            r = retrying.Retrying(retry_on_exception=_retry_on_exception,
-                                  wait_func=_backoff_sleep,
-                                  stop_func=_print_stop)
-            return r.call(f, *args, **kwargs)
+            watch = timeutils.StopWatch().start()
+            for attempt in range(1, retries + 1):
+                try:
+                    return f(*args, **kwargs)
+                except exceptions:
+                    LOG.debug("Failed attempt %s", attempt)
+                    LOG.debug("Have been at this for %s seconds",
+                              watch.elapsed())
+                    if attempt == retries:
+                        raise
+                wait_for = waits[attempt]
+                if jitter:
+                    wait_for = random.uniform(0.5 * wait_for, 1.5 * wait_for)
+                LOG.debug("Sleeping for %s seconds", wait_for)
+                time.sleep(wait_for)
 
         return _wrapper
 
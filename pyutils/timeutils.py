@@ -2,12 +2,23 @@
 Time related utilities and helper functions.
 """
 
+import collections
 import logging
 
-from time import time as now
+from time import monotonic_ns as _now_ns
 
 LOG = logging.getLogger(__name__)
 
+# StopWatch states; plain ints keep the state checks cheap.
+_UNSET, _STARTED, _STOPPED = 0, 1, 2
+
+class Split(collections.namedtuple('Split', ['elapsed', 'length'])):
+    """A *immutable* stopwatch split.
+
+    See: http://en.wikipedia.org/wiki/Stopwatch for what this is/represents.
+    """
+    __slots__ = ()
+
 class StopWatch(object):
     """A simple timer/stopwatch helper class.
 
@@ -18,16 +29,13 @@ class StopWatch(object):
     when operations are performed in a thread-safe manner on these objects by
     wrapping those operations with locks.
 
-    It will use the `monotonic`_ pypi library to find an appropriate
-    monotonically increasing time providing function (which typically varies
-    depending on operating system and python version).
-
-    .. _monotonic: https://pypi.org/project/monotonic/
+    It uses :func:`time.monotonic_ns` so that wall-clock adjustments (NTP steps
+    and the like) do not affect the measured durations.
 
     .. versionadded:: 1.4
     """
-    _STARTED = 'STARTED'
-    _STOPPED = 'STOPPED'
+    __slots__ = ('_duration', '_started_at', '_stopped_at', '_state',
+                 '_splits')
 
     def __init__(self, duration=None):
         if duration is not None and duration < 0:
@@ -36,37 +44,40 @@ class StopWatch(object):
         self._duration = duration
         self._started_at = None
         self._stopped_at = None
-        self._state = None
-        self._splits = ()
+        self._state = _UNSET
+        self._splits = []
 
     def start(self):
         """Starts the watch (if not already started).
 
         NOTE(harlowja): resets any splits previously captured (if any).
         """
-        if self._state == self._STARTED:
+        if self._state == _STARTED:
             return self
-        self._started_at = now()
+        self._started_at = _now_ns()
         self._stopped_at = None
-        self._state = self._STARTED
-        self._splits = ()
+        self._state = _STARTED
+        self._splits = []
         return self
 
     @property
     def splits(self):
         """Accessor to all/any splits that have been captured."""
-        return self._splits
+        return tuple(self._splits)
 
     def split(self):
         """Captures a split/elapsed since start time (and doesn't stop)."""
-        if self._state == self._STARTED:
+        if self._state == _STARTED:
             elapsed = self.elapsed()
             if self._splits:
-                length = self._delta_seconds(self._splits[-1].elapsed, elapsed)
+                length = elapsed - self._splits[-1].elapsed
+                if length < 0.0:
+                    length = 0.0
             else:
                 length = elapsed
-            self._splits = self._splits + (Split(elapsed, length),)
-            return self._splits[-1]
+            split = Split(elapsed, length)
+            self._splits.append(split)
+            return split
         else:
             raise RuntimeError("Can not create a split time of a stopwatch"
                                " if it has not been started or if it has been"
@@ -74,25 +85,24 @@ class StopWatch(object):
 
     def restart(self):
         """Restarts the watch from a started/stopped state."""
-        if self._state == self._STARTED:
+        if self._state == _STARTED:
             self.stop()
         self.start()
         return self
 
-    @staticmethod
-    def _delta_seconds(earlier, later):
-        # Uses max to avoid the delta/time going backwards (and thus negative).
-        return max(0.0, later - earlier)
-
     def elapsed(self, maximum=None):
         """Returns how many seconds have elapsed."""
-        if self._state not in (self._STARTED, self._STOPPED):
+        if self._state == _UNSET:
             raise RuntimeError("Can not get the elapsed time of a stopwatch"
                                " if it has not been started/stopped")
-        if self._state == self._STOPPED:
-            elapsed = self._delta_seconds(self._started_at, self._stopped_at)
+        if self._state == _STOPPED:
+            end = self._stopped_at
         else:
-            elapsed = self._delta_seconds(self._started_at, now())
+            end = _now_ns()
+        # Timestamps are integer nanoseconds; avoid the delta/time going
+        # backwards (and thus negative).
+        delta = end - self._started_at
+        elapsed = delta * 1e-9 if delta > 0 else 0.0
         if maximum is not None and elapsed > maximum:
             elapsed = max(0.0, maximum)
         return elapsed
@@ -117,7 +127,7 @@ class StopWatch(object):
                             return ``None`` instead.
         :type return_none: boolean
         """
-        if self._state != self._STARTED:
+        if self._state != _STARTED:
             raise RuntimeError("Can not get the leftover time of a stopwatch"
                                " that has not been started")
         if self._duration is None:
@@ -129,7 +139,7 @@ class StopWatch(object):
 
     def expired(self):
         """Returns if the watch has expired (ie, duration provided elapsed)."""
-        if self._state not in (self._STARTED, self._STOPPED):
+        if self._state == _UNSET:
             raise RuntimeError("Can not check if a stopwatch has expired"
                                " if it has not been started/stopped")
         if self._duration is None:
@@ -138,16 +148,16 @@ class StopWatch(object):
 
     def has_started(self):
         """Returns True if the watch is in a started state."""
-        return self._state == self._STARTED
+        return self._state == _STARTED
 
     def has_stopped(self):
         """Returns True if the watch is in a stopped state."""
-        return self._state == self._STOPPED
+        return self._state == _STOPPED
 
     def resume(self):
         """Resumes the watch from a stopped state."""
-        if self._state == self._STOPPED:
-            self._state = self._STARTED
+        if self._state == _STOPPED:
+            self._state = _STARTED
             return self
         else:
             raise RuntimeError("Can not resume a stopwatch that has not been"
@@ -155,11 +165,11 @@ class StopWatch(object):
 
     def stop(self):
         """Stops the watch."""
-        if self._state == self._STOPPED:
+        if self._state == _STOPPED:
             return self
-        if self._state != self._STARTED:
+        if self._state != _STARTED:
             raise RuntimeError("Can not stop a stopwatch that has not been"
                                " started")
-        self._stopped_at = now()
-        self._state = self._STOPPED
+        self._stopped_at = _now_ns()
+        self._state = _STOPPED
         return self